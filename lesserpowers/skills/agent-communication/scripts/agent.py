@@ -13,15 +13,26 @@ import sys
 import atexit
 import signal
 import argparse
-import time
 import struct
 from datetime import datetime, UTC
 from pathlib import Path
 from collections import deque
 import threading
+import selectors
 import socket as sock
 
 
+# 4-byte big-endian length prefix framing every socket message
+LENGTH_PREFIX = struct.Struct('>I')
+
+# Largest message body accepted, checked before allocating the buffer (DoS guard)
+MAX_MESSAGE_SIZE = 1024 * 1024  # 1MB
+
+# Shared compact encoder for socket payloads (json.dumps with custom
+# separators would build a new encoder on every call)
+WIRE_ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+
 def get_runtime_dir():
     """Get runtime directory for chat files."""
     return Path(os.environ.get('XDG_RUNTIME_DIR', '/tmp'))
@@ -81,15 +92,29 @@ def check_agent_alive(agent_name):
         return False
 
     try:
-        s = sock.socket(sock.AF_UNIX, sock.SOCK_STREAM)
-        s.settimeout(1.0)
-        s.connect(socket_path)
-        s.close()
+        with sock.socket(sock.AF_UNIX, sock.SOCK_STREAM) as s:
+            s.settimeout(1.0)
+            s.connect(socket_path)
         return True
-    except:
+    except OSError:
         return False
 
 
+def recv_exact(conn, size):
+    """Read exactly size bytes from socket, or None if the peer closed early."""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        # MSG_WAITALL lets the kernel fill the whole remainder in one call;
+        # the loop only repeats when a signal or socket timeout cuts it short
+        count = conn.recv_into(view[received:], size - received, sock.MSG_WAITALL)
+        if not count:
+            return None
+        received += count
+    return buf
+
+
 class Agent:
     """Agent daemon."""
 
@@ -100,17 +125,43 @@ class Agent:
         self.presentation = presentation
         self.cwd = Path(cwd)
 
+        # Sender identity is fixed for the daemon's lifetime, build it once
+        self.sender = {
+            'name': self.name,
+            'context': self.context,
+            'presentation': self.presentation,
+        }
+
         self.local_sock = None
+        self.wakeup_recv = None
+        self.wakeup_send = None
         self.local_socket_path = get_agent_socket_path(self.name)
 
         self.message_queue = deque(maxlen=100)
         self.members = {}
         self.members_lock = threading.Lock()
         self.running = True
+        self.registered = False
         self.message_event = threading.Event()
+        self.active_handlers = 0
+        self.handlers_done = threading.Condition()
+
+        # Command name -> handler, looked up once per request
+        self.commands = {
+            'send': self.cmd_send,
+            'receive': self.cmd_receive,
+            'notify': self.cmd_notify,
+            'status': self.cmd_status,
+            'leave': self.cmd_leave,
+            'batch': self.cmd_batch,
+        }
 
     def cleanup(self):
         """Clean up resources."""
+        # A failed registration means the name and socket belong to another agent
+        if not self.registered:
+            return
+
         # Unregister from registry
         try:
             registry = read_registry()
@@ -120,9 +171,10 @@ class Agent:
         except Exception as e:
             print(f"Error unregistering: {e}", file=sys.stderr)
 
-        # Close local socket
-        if self.local_sock:
-            self.local_sock.close()
+        # Close local socket and server wakeup pair
+        for s in (self.local_sock, self.wakeup_recv, self.wakeup_send):
+            if s:
+                s.close()
 
         # Remove local socket file
         if os.path.exists(self.local_socket_path):
@@ -135,43 +187,61 @@ class Agent:
     def recv_framed_message(self, conn):
         """Read a length-prefixed JSON message from socket."""
         # Read 4-byte length prefix
-        length_data = b''
-        while len(length_data) < 4:
-            chunk = conn.recv(4 - len(length_data))
-            if not chunk:
-                return None
-            length_data += chunk
+        length_data = recv_exact(conn, LENGTH_PREFIX.size)
+        if length_data is None:
+            return None
 
-        message_length = struct.unpack('>I', length_data)[0]
+        message_length, = LENGTH_PREFIX.unpack(length_data)
 
-        # Sanity check on message size (prevent DoS)
-        MAX_MESSAGE_SIZE = 1024 * 1024  # 1MB
+        # Sanity check on message size before reading the body
         if message_length > MAX_MESSAGE_SIZE:
             raise ValueError(f"Message too large: {message_length}")
 
         # Read message body
-        message_data = b''
-        while len(message_data) < message_length:
-            chunk = conn.recv(min(4096, message_length - len(message_data)))
-            if not chunk:
-                return None
-            message_data += chunk
+        message_data = recv_exact(conn, message_length)
+        if message_data is None:
+            return None
 
         return json.loads(message_data.decode('utf-8'))
 
     def send_framed_message(self, conn, message):
         """Send a length-prefixed JSON message to socket."""
-        payload = json.dumps(message).encode('utf-8')
-        conn.sendall(struct.pack('>I', len(payload)) + payload)
+        payload = WIRE_ENCODER.encode(message).encode('utf-8')
+        header = LENGTH_PREFIX.pack(len(payload))
+
+        # Scatter-gather prefix and body in one syscall (no concatenated copy)
+        sent = conn.sendmsg([header, payload])
 
-    def send_to_agent(self, target_name, message):
+        # Finish any short write (possible when the socket has a timeout)
+        if sent < len(header):
+            conn.sendall(header[sent:])
+            sent = len(header)
+        if sent < len(header) + len(payload):
+            conn.sendall(memoryview(payload)[sent - len(header):])
+
+    def build_message(self, msg_type, content):
+        """Build a chat message envelope sent by this agent."""
+        timestamp = datetime.now(UTC).isoformat().replace('+00:00', 'Z')
+        return {
+            'id': f"{self.name}-{timestamp}",
+            'timestamp': timestamp,
+            'type': msg_type,
+            'sender': self.sender,
+            'content': content,
+        }
+
+    def send_to_agent(self, target_name, message, registry=None):
         """Send message directly to another agent's socket.
 
+        Broadcasts pass the registry they already read so a fan-out to N
+        agents costs one registry read instead of N.
+
         Returns:
             (success: bool, error_message: str | None)
         """
         # Look up socket path from registry
-        registry = read_registry()
+        if registry is None:
+            registry = read_registry()
         target = registry.get(target_name)
 
         if not target:
@@ -183,22 +253,26 @@ class Agent:
 
         # Connect and send
         try:
-            s = sock.socket(sock.AF_UNIX, sock.SOCK_STREAM)
-            s.settimeout(5.0)  # 5 second timeout for connection
-            s.connect(socket_path)
+            with sock.socket(sock.AF_UNIX, sock.SOCK_STREAM) as s:
+                s.settimeout(5.0)  # 5 second timeout for connection
+                s.connect(socket_path)
 
-            envelope = {
-                "type": "remote_message",
-                "message": message
-            }
+                envelope = {
+                    "type": "remote_message",
+                    "message": message
+                }
 
-            # Send with length prefix
-            self.send_framed_message(s, envelope)
+                # Send with length prefix
+                self.send_framed_message(s, envelope)
 
-            # Read response
-            response = self.recv_framed_message(s)
+                # Read response
+                response = self.recv_framed_message(s)
 
-            s.close()
+            # A closed socket or error reply means the message was not queued
+            if not response:
+                return (False, f"No response from {target_name}")
+            if response.get('status') != 'ok':
+                return (False, response.get('error', f"Delivery to {target_name} failed"))
 
             return (True, None)
 
@@ -262,6 +336,7 @@ class Agent:
         }
 
         write_registry(registry)
+        self.registered = True
 
         # Update local members cache
         with self.members_lock:
@@ -274,20 +349,10 @@ class Agent:
             members_to_notify = list(self.members.keys())
 
         if members_to_notify:
-            join_msg = {
-                'id': f"{self.name}-{datetime.now(UTC).isoformat().replace('+00:00', 'Z')}",
-                'timestamp': datetime.now(UTC).isoformat().replace('+00:00', 'Z'),
-                'type': 'join',
-                'sender': {
-                    'name': self.name,
-                    'context': self.context,
-                    'presentation': self.presentation,
-                },
-                'content': self.presentation,
-            }
+            join_msg = self.build_message('join', self.presentation)
 
             for agent_name in members_to_notify:
-                success, error = self.send_to_agent(agent_name, join_msg)
+                success, error = self.send_to_agent(agent_name, join_msg, registry)
                 if not success:
                     print(f"Could not notify {agent_name} of join: {error}", file=sys.stderr)
 
@@ -307,25 +372,14 @@ class Agent:
         if not members_to_send:
             return {'delivered_to': [], 'failed': {}}
 
-        timestamp = datetime.now(UTC).isoformat().replace('+00:00', 'Z')
-        msg = {
-            'id': f"{self.name}-{timestamp}",
-            'timestamp': timestamp,
-            'type': 'message',
-            'sender': {
-                'name': self.name,
-                'context': self.context,
-                'presentation': self.presentation,
-            },
-            'content': content,
-        }
+        msg = self.build_message('message', content)
 
         delivered = []
         failed = {}
 
         # Iterate over copy to avoid dictionary changed size during iteration
         for agent_name in members_to_send:
-            success, error = self.send_to_agent(agent_name, msg)
+            success, error = self.send_to_agent(agent_name, msg, registry)
             if success:
                 delivered.append(agent_name)
             else:
@@ -342,8 +396,14 @@ class Agent:
         # Create Unix socket
         self.local_sock = sock.socket(sock.AF_UNIX, sock.SOCK_STREAM)
         self.local_sock.bind(self.local_socket_path)
-        self.local_sock.listen(5)
-        self.local_sock.settimeout(1.0)
+        # Deep backlog: timed connects (send_to_agent) fail with EAGAIN, not
+        # wait, when it's full, so bursts of deliveries would be dropped
+        self.local_sock.listen(sock.SOMAXCONN)
+        self.local_sock.setblocking(False)
+
+        # Socket pair used to wake the server loop when the agent stops
+        self.wakeup_recv, self.wakeup_send = sock.socketpair()
+        self.wakeup_send.setblocking(False)
 
         print(f"Agent listening on {self.local_socket_path}", file=sys.stderr)
         print(f"Agent name: {self.name}", file=sys.stderr)
@@ -354,103 +414,184 @@ class Agent:
             members_to_notify = list(self.members.keys())
 
         if members_to_notify:
-            leave_msg = {
-                'id': f"{self.name}-{datetime.now(UTC).isoformat().replace('+00:00', 'Z')}",
-                'timestamp': datetime.now(UTC).isoformat().replace('+00:00', 'Z'),
-                'type': 'leave',
-                'sender': {
-                    'name': self.name,
-                    'context': self.context,
-                    'presentation': self.presentation,
-                },
-                'content': '',
-            }
+            leave_msg = self.build_message('leave', '')
+            registry = read_registry()
 
             for agent_name in members_to_notify:
                 try:
-                    self.send_to_agent(agent_name, leave_msg)
-                except:
+                    self.send_to_agent(agent_name, leave_msg, registry)
+                except (OSError, ValueError):
                     pass  # Best effort
 
-    def handle_command(self, cmd):
-        """Handle command from chat.py."""
-        command = cmd.get('command')
+    def cmd_send(self, args):
+        """Send a message to all other agents."""
+        # Block sending if there are unread messages
+        if self.message_queue:
+            return {
+                'status': 'error',
+                'error': f'Cannot send: {len(self.message_queue)} unread message(s). Use "receive" first.'
+            }
 
-        if command == 'send':
-            # Block sending if there are unread messages
-            if self.message_queue:
-                return {
-                    'status': 'error',
-                    'error': f'Cannot send: {len(self.message_queue)} unread message(s). Use "receive" first.'
-                }
+        content = args.get('content', '')
+        result = self.send_message_to_agents(content)
 
-            content = cmd.get('args', {}).get('content', '')
-            result = self.send_message_to_agents(content)
+        # Include delivery report
+        return {
+            'status': 'ok',
+            'data': result
+        }
 
-            # Include delivery report
-            return {
-                'status': 'ok',
-                'data': result
-            }
+    def cmd_receive(self, args):
+        """Drain queued messages, waiting for one if the queue is empty."""
+        messages = []
+
+        # Clear event first (before draining - prevents race condition)
+        self.message_event.clear()
 
-        elif command == 'receive':
-            messages = []
+        # Checked after the clear so a concurrent leave can't be missed
+        if not self.running:
+            return {'status': 'error', 'error': 'Agent left the chat'}
 
-            # Clear event first (before draining - prevents race condition)
-            self.message_event.clear()
+        # Drain existing queue
+        while self.message_queue:
+            messages.append(self.message_queue.popleft())
 
-            # Drain existing queue
+        # If no messages yet, wait for event
+        if not messages:
+            self.message_event.wait()
+            if not self.running:
+                return {'status': 'error', 'error': 'Agent left the chat'}
             while self.message_queue:
                 messages.append(self.message_queue.popleft())
 
-            # If no messages yet, wait for event
-            if not messages:
-                self.message_event.wait()
-                while self.message_queue:
-                    messages.append(self.message_queue.popleft())
+        return {'status': 'ok', 'data': {'messages': messages}}
 
-            return {'status': 'ok', 'data': {'messages': messages}}
+    def cmd_notify(self, args):
+        """Wait until a message is queued and return the queue size."""
+        # Clear event first (before checking the queue - prevents race condition)
+        self.message_event.clear()
 
-        elif command == 'notify':
-            # Check if there are already messages in queue
-            if self.message_queue:
-                return {'status': 'ok', 'data': {'count': len(self.message_queue)}}
+        # Checked after the clear so a concurrent leave can't be missed
+        if not self.running:
+            return {'status': 'error', 'error': 'Agent left the chat'}
 
-            # No messages, wait for the event (indefinitely)
-            self.message_event.clear()
-            self.message_event.wait()
-
-            # Message arrived, return count
+        # Check if there are already messages in queue
+        if self.message_queue:
             return {'status': 'ok', 'data': {'count': len(self.message_queue)}}
 
-        elif command == 'status':
-            return {
-                'status': 'ok',
-                'data': {
-                    'agent': {
-                        'name': self.name,
-                        'context': self.context,
-                    },
-                    'members': self.members,
-                    'queue_size': len(self.message_queue),
-                }
+        # No messages, wait for the event (indefinitely)
+        self.message_event.wait()
+        if not self.running:
+            return {'status': 'error', 'error': 'Agent left the chat'}
+
+        # Message arrived, return count
+        return {'status': 'ok', 'data': {'count': len(self.message_queue)}}
+
+    def cmd_status(self, args):
+        """Report agent identity, members and queue size.
+
+        An optional 'fields' list limits the report to those keys.
+        """
+        fields = args.get('fields') or ('agent', 'members', 'queue_size')
+        if not isinstance(fields, (list, tuple)):
+            return {'status': 'error', 'error': 'Status fields must be a list'}
+
+        data = {}
+
+        if 'agent' in fields:
+            data['agent'] = {
+                'name': self.name,
+                'context': self.context,
             }
 
-        elif command == 'leave':
-            # Broadcast leave message
-            self.broadcast_leave()
+        if 'members' in fields:
+            # Snapshot under lock so serialization can't race a join/leave
+            with self.members_lock:
+                data['members'] = dict(self.members)
+
+        if 'queue_size' in fields:
+            data['queue_size'] = len(self.message_queue)
 
-            # Stop the agent
-            self.running = False
+        return {'status': 'ok', 'data': data}
 
-            return {'status': 'ok', 'message': 'Left chat successfully'}
+    def cmd_leave(self, args):
+        """Broadcast leave and stop the agent."""
+        # Broadcast leave message
+        self.broadcast_leave()
 
-        else:
+        # Stop the agent and release any parked receive/notify waiters
+        self.running = False
+        self.message_event.set()
+
+        return {'status': 'ok', 'message': 'Left chat successfully'}
+
+    def cmd_batch(self, args):
+        """Run several commands in one request, stopping at the first error.
+
+        Lets clients like chat.py's ask do send + receive in one round trip.
+        """
+        steps = args.get('steps', [])
+        if not isinstance(steps, list):
+            return {'status': 'error', 'error': 'Batch steps must be a list'}
+
+        stop_on_error = args.get('stop_on_error', True)
+        results = []
+
+        for step in steps:
+            if not isinstance(step, dict):
+                result = {'status': 'error', 'error': f'Invalid batch step: {step!r}'}
+            elif step.get('command') == 'batch':
+                result = {'status': 'error', 'error': 'Nested batch is not allowed'}
+            else:
+                result = self.handle_command(step)
+
+            results.append(result)
+            if stop_on_error and result['status'] != 'ok':
+                break
+
+            # Nothing can run once the agent has left
+            if not self.running:
+                break
+
+        return {'status': 'ok', 'data': {'results': results}}
+
+    def handle_command(self, cmd):
+        """Handle command from chat.py."""
+        command = cmd.get('command')
+        handler = self.commands.get(command)
+
+        if handler is None:
             return {'status': 'error', 'error': f'Unknown command: {command}'}
 
+        # Normalize once here so handlers never see a null args
+        return handler(cmd.get('args') or {})
+
+    def is_trusted_peer(self, conn):
+        """Check that the connecting process runs as the same user as the agent."""
+        # Peer credentials are Linux-only; elsewhere rely on socket permissions
+        if not hasattr(sock, 'SO_PEERCRED'):
+            return True
+
+        creds = conn.getsockopt(sock.SOL_SOCKET, sock.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', creds)
+        return uid == os.getuid()
+
     def _handle_connection(self, conn):
         """Handle a single connection in its own thread."""
         try:
+            # Reject clients from other users (socket may live in shared /tmp)
+            if not self.is_trusted_peer(conn):
+                print("Rejected connection from another user", file=sys.stderr)
+                # Consume the request (briefly) so the peer is not cut off
+                # mid-send and can read the rejection
+                conn.settimeout(1.0)
+                self.recv_framed_message(conn)
+                self.send_framed_message(conn, {
+                    'status': 'error',
+                    'error': 'Connection rejected: peer runs as a different user'
+                })
+                return
+
             # No timeout - wait indefinitely
             conn.settimeout(None)
             envelope = self.recv_framed_message(conn)
@@ -469,31 +610,82 @@ class Agent:
             self.send_framed_message(conn, response)
         except BrokenPipeError:
             pass
+        except ValueError as e:
+            # Oversized or malformed request: tell the client instead of hanging up
+            try:
+                self.send_framed_message(conn, {'status': 'error', 'error': str(e)})
+            except OSError:
+                pass
         except Exception as e:
             if self.running:
                 print(f"Error handling connection: {e}", file=sys.stderr)
         finally:
             try:
                 conn.close()
-            except:
+            except OSError:
                 pass
 
+            with self.handlers_done:
+                self.active_handlers -= 1
+                self.handlers_done.notify_all()
+
+            # Leave stops the agent only after its response went out
+            if not self.running:
+                self.wake_server()
+
+    def wake_server(self):
+        """Wake the server loop so it notices the agent stopped."""
+        try:
+            self.wakeup_send.send(b'\0')
+        except OSError:
+            pass  # Already woken (buffer full) or shutting down
+
     def run_local_server(self):
         """Run server loop spawning handler threads for each connection."""
-        while self.running:
-            try:
-                conn, addr = self.local_sock.accept()
-                handler = threading.Thread(
-                    target=self._handle_connection,
-                    args=(conn,),
-                    daemon=True
-                )
-                handler.start()
-            except sock.timeout:
-                continue
-            except Exception as e:
-                if self.running:
-                    print(f"Error accepting connection: {e}", file=sys.stderr)
+        selector = selectors.DefaultSelector()
+        selector.register(self.local_sock, selectors.EVENT_READ)
+        selector.register(self.wakeup_recv, selectors.EVENT_READ)
+
+        try:
+            while self.running:
+                for key, _ in selector.select():
+                    if key.fileobj is self.wakeup_recv:
+                        self.wakeup_recv.recv(4096)
+                        continue
+
+                    try:
+                        conn, addr = self.local_sock.accept()
+                    except BlockingIOError:
+                        continue  # Client gave up before we got to it
+                    except Exception as e:
+                        if self.running:
+                            print(f"Error accepting connection: {e}", file=sys.stderr)
+                        continue
+
+                    try:
+                        with self.handlers_done:
+                            self.active_handlers += 1
+
+                        handler = threading.Thread(
+                            target=self._handle_connection,
+                            args=(conn,),
+                            daemon=True
+                        )
+                        handler.start()
+                    except Exception as e:
+                        # e.g. "can't start new thread": drop this client, keep serving
+                        with self.handlers_done:
+                            self.active_handlers -= 1
+                            self.handlers_done.notify_all()
+                        conn.close()
+                        print(f"Error accepting connection: {e}", file=sys.stderr)
+                        continue
+        finally:
+            selector.close()
+
+        # Let in-flight replies (e.g. released receive/notify waiters) go out
+        with self.handlers_done:
+            self.handlers_done.wait_for(lambda: self.active_handlers == 0, timeout=1.0)
 
     def run(self):
         """Run the agent."""
@@ -549,27 +741,7 @@ def main():
         agent.running = False
 
         # Broadcast leave message via socket (not file)
-        with agent.members_lock:
-            members_to_notify = list(agent.members.keys())
-
-        if members_to_notify:
-            leave_msg = {
-                'id': f"{agent.name}-{datetime.now(UTC).isoformat().replace('+00:00', 'Z')}",
-                'timestamp': datetime.now(UTC).isoformat().replace('+00:00', 'Z'),
-                'type': 'leave',
-                'sender': {
-                    'name': agent.name,
-                    'context': agent.context,
-                    'presentation': agent.presentation,
-                },
-                'content': '',
-            }
-
-            for agent_name in members_to_notify:
-                try:
-                    agent.send_to_agent(agent_name, leave_msg)
-                except:
-                    pass  # Best effort
+        agent.broadcast_leave()
 
         agent.cleanup()
         sys.exit(0)
@@ -15,6 +15,39 @@ import os
 from pathlib import Path
 
 
+# 4-byte big-endian length prefix framing every socket message
+LENGTH_PREFIX = struct.Struct('>I')
+
+# Largest request body the agent accepts (mirrors agent.py)
+MAX_MESSAGE_SIZE = 1024 * 1024  # 1MB
+
+
+def recv_exact(s, size):
+    """Read exactly size bytes from socket, or None if the peer closed early."""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        count = s.recv_into(view[received:], size - received, socket.MSG_WAITALL)
+        if not count:
+            return None
+        received += count
+    return buf
+
+
+def send_framed(s, payload):
+    """Send payload behind its length prefix, scatter-gathered in one syscall."""
+    header = LENGTH_PREFIX.pack(len(payload))
+    sent = s.sendmsg([header, payload])
+
+    # Finish any short write (possible when the socket has a timeout)
+    if sent < len(header):
+        s.sendall(header[sent:])
+        sent = len(header)
+    if sent < len(header) + len(payload):
+        s.sendall(memoryview(payload)[sent - len(header):])
+
+
 def get_runtime_dir():
     """Get runtime directory for socket files."""
     return Path(os.environ.get('XDG_RUNTIME_DIR', '/tmp'))
@@ -47,24 +80,20 @@ def send_command(sock_path, command, args=None):
 
         # Send with length prefix
         payload = json.dumps(envelope).encode('utf-8')
-        s.sendall(struct.pack('>I', len(payload)) + payload)
+        if len(payload) > MAX_MESSAGE_SIZE:
+            raise Exception(f"Message too large: {len(payload)} bytes (limit {MAX_MESSAGE_SIZE})")
+        send_framed(s, payload)
 
         # Receive response with length prefix
-        length_data = b''
-        while len(length_data) < 4:
-            chunk = s.recv(4 - len(length_data))
-            if not chunk:
-                raise Exception("Connection closed by server")
-            length_data += chunk
-
-        response_length = struct.unpack('>I', length_data)[0]
-
-        response_data = b''
-        while len(response_data) < response_length:
-            chunk = s.recv(min(4096, response_length - len(response_data)))
-            if not chunk:
-                break
-            response_data += chunk
+        length_data = recv_exact(s, LENGTH_PREFIX.size)
+        if length_data is None:
+            raise Exception("Connection closed by server")
+
+        response_length, = LENGTH_PREFIX.unpack(length_data)
+
+        response_data = recv_exact(s, response_length)
+        if response_data is None:
+            raise Exception("Connection closed by server")
 
         response = json.loads(response_data.decode('utf-8'))
         s.close()
@@ -133,17 +162,36 @@ def cmd_status(args, sock_path):
 
 def cmd_ask(args, sock_path):
     """Send a message and wait for response."""
-    # First, send the message
-    send_response = send_command(sock_path, 'send', {'content': args.message})
-
-    if send_response['status'] != 'ok':
-        print(json.dumps(send_response))
+    print(json.dumps({'status': 'ok', 'message': 'Sending message and waiting for response...'}), file=sys.stderr)
+
+    # Send and receive in a single agent request
+    response = send_command(sock_path, 'batch', {
+        'steps': [
+            {'command': 'send', 'args': {'content': args.message}},
+            {'command': 'receive', 'args': {}},
+        ]
+    })
+
+    if response.get('error') == 'Unknown command: batch':
+        # Agent predates batch: fall back to separate send and receive requests
+        send_response = send_command(sock_path, 'send', {'content': args.message})
+        if send_response['status'] != 'ok':
+            print(json.dumps(send_response))
+            return 1
+
+        receive_response = send_command(sock_path, 'receive', {})
+    elif response['status'] != 'ok':
+        print(json.dumps(response))
         return 1
+    else:
+        results = response['data']['results']
+        send_response = results[0]
 
-    print(json.dumps({'status': 'ok', 'message': 'Message sent, waiting for response...'}), file=sys.stderr)
+        if send_response['status'] != 'ok':
+            print(json.dumps(send_response))
+            return 1
 
-    # Then wait for responses
-    receive_response = send_command(sock_path, 'receive', {})
+        receive_response = results[1]
 
     if receive_response['status'] == 'ok':
         messages = receive_response['data']['messages']
@@ -11,6 +11,7 @@ import json
 import argparse
 import subprocess
 import signal
+import select
 import time
 import struct
 import threading
@@ -20,6 +21,39 @@ from pathlib import Path
 from datetime import datetime
 
 
+# 4-byte big-endian length prefix framing every socket message
+LENGTH_PREFIX = struct.Struct('>I')
+
+# Largest request body the agent accepts (mirrors agent.py)
+MAX_MESSAGE_SIZE = 1024 * 1024  # 1MB
+
+
+def recv_exact(s, size):
+    """Read exactly size bytes from socket, or None if the peer closed early."""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        count = s.recv_into(view[received:], size - received, sock.MSG_WAITALL)
+        if not count:
+            return None
+        received += count
+    return buf
+
+
+def send_framed(s, payload):
+    """Send payload behind its length prefix, scatter-gathered in one syscall."""
+    header = LENGTH_PREFIX.pack(len(payload))
+    sent = s.sendmsg([header, payload])
+
+    # Finish any short write (possible when the socket has a timeout)
+    if sent < len(header):
+        s.sendall(header[sent:])
+        sent = len(header)
+    if sent < len(header) + len(payload):
+        s.sendall(memoryview(payload)[sent - len(header):])
+
+
 def get_runtime_dir():
     """Get runtime directory for socket files."""
     return Path(os.environ.get('XDG_RUNTIME_DIR', '/tmp'))
@@ -57,24 +91,20 @@ def send_command(sock_path, command, args=None):
 
         # Send with length prefix
         payload = json.dumps(envelope).encode('utf-8')
-        s.sendall(struct.pack('>I', len(payload)) + payload)
+        if len(payload) > MAX_MESSAGE_SIZE:
+            raise Exception(f"Message too large: {len(payload)} bytes (limit {MAX_MESSAGE_SIZE})")
+        send_framed(s, payload)
 
         # Receive response with length prefix
-        length_data = b''
-        while len(length_data) < 4:
-            chunk = s.recv(4 - len(length_data))
-            if not chunk:
-                raise Exception("Connection closed by server")
-            length_data += chunk
+        length_data = recv_exact(s, LENGTH_PREFIX.size)
+        if length_data is None:
+            raise Exception("Connection closed by server")
 
-        response_length = struct.unpack('>I', length_data)[0]
+        response_length, = LENGTH_PREFIX.unpack(length_data)
 
-        response_data = b''
-        while len(response_data) < response_length:
-            chunk = s.recv(min(4096, response_length - len(response_data)))
-            if not chunk:
-                break
-            response_data += chunk
+        response_data = recv_exact(s, response_length)
+        if response_data is None:
+            raise Exception("Connection closed by server")
 
         response = json.loads(response_data.decode('utf-8'))
         s.close()
@@ -198,16 +228,25 @@ class HumanCLI:
             stderr=subprocess.PIPE,
         )
 
-        # Wait for socket to be ready
-        max_wait = 5
-        for _ in range(max_wait * 10):
-            if os.path.exists(self.sock_path):
-                time.sleep(0.2)  # Extra time for socket to be ready
-                break
-            time.sleep(0.1)
-        else:
-            self.print_colored("Error: Agent daemon did not start in time", self.COLOR_YELLOW)
-            sys.exit(1)
+        # Wait for the agent to report it is listening by watching its stderr
+        # pipe, so we wake as soon as it's ready (or as soon as it dies)
+        deadline = time.monotonic() + 5
+        stderr_fd = self.agent_process.stderr.fileno()
+        output = b''
+        while b'Agent listening on' not in output:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([stderr_fd], [], [], remaining)[0]:
+                self.print_colored("Error: Agent daemon did not start in time", self.COLOR_YELLOW)
+                sys.exit(1)
+
+            chunk = os.read(stderr_fd, 4096)
+            if not chunk:
+                # Agent exited before listening (e.g. name already in use)
+                self.agent_process.wait()
+                reason = output.decode('utf-8', 'replace').strip()
+                self.print_colored(f"Error: Agent daemon failed to start: {reason}", self.COLOR_YELLOW)
+                sys.exit(1)
+            output += chunk
 
         self.print_colored(f"Connected as: {self.name}", self.COLOR_GREEN)
         self.print_colored(f"Context: {self.context}", self.COLOR_GRAY)
@@ -215,7 +254,8 @@ class HumanCLI:
 
     def stop_agent(self):
         """Stop agent daemon gracefully."""
-        if self.agent_process:
+        # Skip if it already exited: the socket may then belong to another agent
+        if self.agent_process and self.agent_process.poll() is None:
             # Send leave command to agent
             try:
                 response = send_command(self.sock_path, 'leave')
@@ -242,13 +282,17 @@ class HumanCLI:
 
     def message_receiver_loop(self):
         """Background thread to wait for and display messages."""
+        retry_delay = 0.01
         while self.running:
             try:
-                # Use notify to wait for messages (will wait indefinitely)
-                # The socket timeout in send_command (5s) will cause this to retry periodically
+                # Use notify to wait for messages; the socket timeout in
+                # send_command (5s) ends the wait, and each timeout goes
+                # through the backoff below before notify is retried
                 notify_response = send_command(self.sock_path, 'notify', {})
 
                 if notify_response['status'] == 'ok' and self.running:
+                    retry_delay = 0.01
+
                     # Messages available, receive them
                     receive_response = send_command(self.sock_path, 'receive', {})
 
@@ -256,10 +300,15 @@ class HumanCLI:
                         messages = receive_response.get('data', {}).get('messages', [])
                         for msg in messages:
                             self.display_message(msg)
+                    continue
+
+            except Exception:
+                pass
 
-            except Exception as e:
-                if self.running:
-                    time.sleep(1)
+            # Notify failed or timed out: back off instead of spinning on the socket
+            if self.running:
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 0.2)
 
     def cmd_help(self):
         """Show help."""
@@ -289,7 +338,7 @@ class HumanCLI:
 
     def cmd_members(self):
         """List members."""
-        response = send_command(self.sock_path, 'status')
+        response = send_command(self.sock_path, 'status', {'fields': ['members']})
 
         if response['status'] == 'ok':
             members = response['data']['members']